@@ -256,6 +256,7 @@ def end_session():
         with db_lock:
             session_db = SessionDB()
             session_db.save_session(session_obj)
+            session_db.close()
         session_data = session_obj.to_dict()
     
     # Clean up
@@ -615,6 +616,7 @@ def get_relevant_theorems():
         question_id: Question identifier
         answer_id: Answer identifier
         base_threshold: Minimum threshold for theorem weights (optional, default: 0.01)
+        top_k: Return only the top K theorems (optional, default: all)
     
     Returns:
         theorems: List of relevant theorems sorted by relevance score
@@ -629,6 +631,7 @@ def get_relevant_theorems():
     question_id = data.get('question_id')
     answer_id = data.get('answer_id')
     base_threshold = data.get('base_threshold', 0.01)
+    top_k = data.get('top_k')
     
     if question_id is None or answer_id is None:
         gm.close()
@@ -637,7 +640,15 @@ def get_relevant_theorems():
             "message": "Both question_id and answer_id are required"
         }), 400
     
-    theorems = gm.get_relevant_theorems(question_id, answer_id, base_threshold)
+    # bool is a subclass of int in Python - reject JSON true/false explicitly
+    if top_k is not None and (isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1):
+        gm.close()
+        return jsonify({
+            "error": "Invalid top_k",
+            "message": "top_k must be a positive integer"
+        }), 400
+    
+    theorems = gm.get_relevant_theorems(question_id, answer_id, base_threshold, top_k=top_k)
     
     gm.close()
     
@@ -668,6 +679,7 @@ def get_session_history():
     with db_lock:
         session_db = SessionDB()
         all_sessions = session_db.load_all_sessions()
+        session_db.close()
     
     total = len(all_sessions)
     
@@ -722,6 +734,7 @@ def get_session_statistics():
     with db_lock:
         session_db = SessionDB()
         all_sessions = session_db.load_all_sessions()
+        session_db.close()
     
     if not all_sessions:
         return jsonify({
@@ -1,7 +1,5 @@
 import sqlite3
-import json
-import uuid
-from session_db import SessionDB
+from session_db import SessionDB, loads_session
 from session import Session
 
 # הגדרת הנתיב למסד הנתונים
@@ -11,7 +9,7 @@ def load_all_sessions():
     """ טוען את כל הסשנים השמורים במסד הנתונים ומציג אותם """
     with sqlite3.connect(db_path) as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT session_id, data FROM sessions")
+        cursor.execute("SELECT session_id, data FROM sessions ORDER BY rowid")
         rows = cursor.fetchall()
 
         if not rows:
@@ -20,7 +18,7 @@ def load_all_sessions():
 
         print("\n📌 רשימת הסשנים השמורים במסד הנתונים:")
         for session_id, data in rows:
-            session_data = json.loads(data)  # המרת ה-JSON למילון
+            session_data = loads_session(data)  # המרת ה-msgpack/JSON למילון
 
             print(f"\n🔹 מזהה סשן: {session_id}")
             print(f"   אינטראקציות: {session_data.get('interactions', [])}")
@@ -91,14 +89,19 @@ def generate_fake_session_interactively():
                 break
             print("⚠️ מספר לא תקין.")
 
-        db = SessionDB()
+        new_sessions = []
         for _ in range(n):
             new_session = Session()  # נשתמש בהעתק כדי לייצר מזהה חדש
             new_session.interactions = session.interactions.copy()
             new_session.feedback = session.feedback
             new_session.triangle_type = session.triangle_type.copy() if session.triangle_type else None
             new_session.helpful_theorems = session.helpful_theorems.copy()
-            db.save_session(new_session)
+            new_sessions.append(new_session)
+
+        # כל העותקים נשמרים בטרנזקציה אחת
+        db = SessionDB()
+        db.save_sessions(new_sessions)
+        db.close()
 
         print(f"\n✅ הוזנו {n} סשנים פיקטיביים למסד הנתונים.")
 
@@ -116,35 +119,38 @@ def clone_existing_session(db_path="sessions.db"):
         cursor.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id_to_clone,))
         row = cursor.fetchone()
 
-        if not row:
-            print("❌ סשן עם המזהה הזה לא נמצא.")
-            return
-
-        # המרת ה־JSON לאובייקט
-        session_data = json.loads(row[0])
-
-        # שאל כמה עותקים לשכפל
-        try:
-            n = int(input("🔁 כמה עותקים לשכפל? "))
-        except ValueError:
-            print("⚠️ מספר לא תקין.")
-            return
+    if not row:
+        print("❌ סשן עם המזהה הזה לא נמצא.")
+        return
 
-        # הכנסת עותקים
-        inserted = 0
-        for _ in range(n):
-            new_id = str(uuid.uuid4())
-            session_data_copy = session_data.copy()
-            session_data_copy["session_id"] = new_id
+    # המרת ה־msgpack/JSON לאובייקט
+    session_data = loads_session(row[0])
 
-            cursor.execute("INSERT INTO sessions (session_id, data) VALUES (?, ?)",
-                           (new_id, json.dumps(session_data_copy, ensure_ascii=False)))
+    # שאל כמה עותקים לשכפל
+    try:
+        n = int(input("🔁 כמה עותקים לשכפל? "))
+    except ValueError:
+        print("⚠️ מספר לא תקין.")
+        return
 
-            inserted += 1
+    # כל עותק נבנה כ־Session עם מזהה חדש, כדי שיישמר באותו פורמט כמו כל שאר המסלולים
+    new_sessions = []
+    for _ in range(n):
+        new_session = Session()
+        for interaction in session_data.get("interactions", []):
+            new_session.add_interaction(interaction["question_id"], interaction["answer_id"])
+        new_session.feedback = session_data.get("feedback")
+        triangle_type = session_data.get("triangle_type")
+        new_session.triangle_type = list(triangle_type) if triangle_type else None
+        new_session.helpful_theorems = list(session_data.get("helpful_theorems", []))
+        new_sessions.append(new_session)
 
-        conn.commit()
+    # כל העותקים נשמרים בטרנזקציה אחת
+    db = SessionDB(db_path)
+    db.save_sessions(new_sessions)
+    db.close()
 
-        print(f"\n✅ {inserted} סשנים שוכפלו בהצלחה מתוך הסשן {session_id_to_clone}.")
+    print(f"\n✅ {len(new_sessions)} סשנים שוכפלו בהצלחה מתוך הסשן {session_id_to_clone}.")
 
 
 def delete_session_by_id(db_path="sessions.db"):
@@ -184,6 +190,51 @@ def delete_session_by_id(db_path="sessions.db"):
     except sqlite3.Error as e:
         print(f"❌ שגיאת מסד נתונים: {e}")
 
+
+## פעולות תחזוקה חד־פעמיות על מסד המסלולים (לא מתבצעות אוטומטית)
+def migrate_legacy_sessions_table(db_path="sessions.db"):
+    """ ממיר טבלת מסלולים ישנה (עם עמודת id) למבנה הנוכחי, תוך שמירה על סדר המסלולים """
+    db = SessionDB(db_path)
+    try:
+        migrated = db.migrate_legacy_table()
+    finally:
+        db.close()
+
+    if migrated is None:
+        print("ℹ️ טבלת המסלולים כבר במבנה הנוכחי.")
+    else:
+        print(f"✅ הטבלה הומרה – {migrated} סשנים הועתקו.")
+
+
+def convert_sessions_to_msgpack(db_path="sessions.db"):
+    """ ממיר את כל המסלולים השמורים כ־JSON ל־msgpack """
+    confirm = input("‼️ לאחר ההמרה כל תהליך שקורא את המסד יצטרך את החבילה msgpack. להמשיך? (y/n): ")
+    if confirm.strip().lower() != "y":
+        print("↩️ פעולה בוטלה.")
+        return
+
+    db = SessionDB(db_path)
+    try:
+        converted = db.migrate_to_msgpack()
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return
+    finally:
+        db.close()
+
+    print(f"✅ {converted} סשנים הומרו ל־msgpack.")
+
+
+def enable_incremental_vacuum(db_path="sessions.db"):
+    """ מעביר מסד קיים ל־auto_vacuum מצטבר (VACUUM מלא אחד) """
+    db = SessionDB(db_path)
+    try:
+        db.enable_incremental_vacuum()
+    finally:
+        db.close()
+
+    print("✅ auto_vacuum מצטבר הופעל – דפים פנויים ישוחררו בניקוי הסשנים.")
+
 # הפעלת הבדיקה
 if __name__ == "__main__":
     print("\n📋 תפריט:")
@@ -191,8 +242,11 @@ if __name__ == "__main__":
     print("2. יצירת סשן פיקטיבי חדש")
     print("3. שכפול סשן קיים")
     print("4. מחיקת סשן לפי מזהה")
+    print("5. המרת טבלת סשנים ישנה למבנה הנוכחי")
+    print("6. המרת סשני JSON ל־msgpack")
+    print("7. הפעלת auto_vacuum מצטבר")
 
-    choice = input("👉 בחר פעולה (1/2/3/4): ").strip()
+    choice = input("👉 בחר פעולה (1-7): ").strip()
 
     if choice == "1":
         load_all_sessions()
@@ -202,6 +256,12 @@ if __name__ == "__main__":
         clone_existing_session()
     elif choice == "4":  # ← חדש
         delete_session_by_id(db_path)
+    elif choice == "5":
+        migrate_legacy_sessions_table(db_path)
+    elif choice == "6":
+        convert_sessions_to_msgpack(db_path)
+    elif choice == "7":
+        enable_incremental_vacuum(db_path)
     else:
         print("⚠️ בחירה לא תקפה.")
 
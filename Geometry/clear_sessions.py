@@ -5,6 +5,11 @@ def clear_all_sessions(db_path="sessions.db"):
         cursor = conn.cursor()
         cursor.execute("DELETE FROM sessions")
         conn.commit()
+
+        # במסד עם auto_vacuum=INCREMENTAL (2) – החזרת הדפים שהתפנו בלי VACUUM מלא.
+        # executescript מריץ את ה־PRAGMA עד הסוף (execute רגיל משחרר דף אחד בלבד)
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            conn.executescript("PRAGMA incremental_vacuum;")
         print("🧹 כל הסשנים נמחקו מהמסד בהצלחה.")
 
 if __name__ == "__main__":
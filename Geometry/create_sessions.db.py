@@ -9,9 +9,8 @@ try:
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT UNIQUE,
-                data TEXT
+                session_id TEXT PRIMARY KEY NOT NULL,
+                data BLOB NOT NULL
             )
         ''')
         conn.commit()
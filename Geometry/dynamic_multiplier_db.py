@@ -1,6 +1,14 @@
 import sqlite3
-from session_db import SessionDB
-import json
+import sys
+from session_db import SessionDB, dumps_pretty
+
+
+def _connect(db_path):
+    """
+    פותחת חיבור במצב autocommit (isolation_level=None) –
+    את הטרנזקציות פותחים ומסיימים במפורש עם BEGIN IMMEDIATE / COMMIT.
+    """
+    return sqlite3.connect(db_path, isolation_level=None)
 
 
 session_db = SessionDB("sessions.db")
@@ -34,32 +42,47 @@ def preview_sessions_from_db():
 
     for i, session in enumerate(sessions, 1):
         print(f"\n📄 סשן {i}:")
-        print(json.dumps(session, indent=4, ensure_ascii=False))
+        print(dumps_pretty(session))
 
 
 ## יצירת הטבלה של המשקולות הדינאמיות
 def create_dynamic_multipliers_table(db_path="geometry_learning.db"):
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.cursor()
 
     # הפעלת תמיכה במפתחות זרים
     cursor.execute("PRAGMA foreign_keys = ON;")
 
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS DynamicAnswerMultipliers (
-        question_id INTEGER,
-        triangle_id INTEGER,
-        answer_id INTEGER,
-        baseline_multiplier REAL NOT NULL,
-        dynamic_multiplier REAL,  -- יכול להיות null
-        session_count_total INTEGER DEFAULT 0,
-        session_count_with_triangle INTEGER DEFAULT 0,
-        PRIMARY KEY (question_id, triangle_id, answer_id)
-    )
-    """)
+    # יצירת הטבלה והאינדקס בטרנזקציה אחת (commit יחיד)
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS DynamicAnswerMultipliers (
+            question_id INTEGER,
+            triangle_id INTEGER,
+            answer_id INTEGER,
+            baseline_multiplier REAL NOT NULL,
+            dynamic_multiplier REAL,  -- יכול להיות null
+            session_count_total INTEGER DEFAULT 0,
+            session_count_with_triangle INTEGER DEFAULT 0,
+            PRIMARY KEY (question_id, triangle_id, answer_id)
+        )
+        """)
+
+        # אינדקס חלקי לשורות שניתנות לעדכון דינאמי (baseline שונה מ־0 ו־1)
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_multipliers_updatable
+        ON DynamicAnswerMultipliers (question_id, triangle_id, answer_id)
+        WHERE baseline_multiplier NOT IN (0, 1)
+        """)
+
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
 
-    conn.commit()
-    conn.close()
     print("✅ טבלת DynamicAnswerMultipliers נוצרה בהצלחה (עם answer_id מספרי בלבד).")
 
 ##לטעון את הנתונים המקוריים מהטבלה הקשיחה והמקורית
@@ -68,7 +91,7 @@ def load_initial_multipliers(db_path="geometry_learning.db"):
     טוען את כל הרשומות מטבלת InitialAnswerMultipliers ומחזיר רשימה של טפלות:
     (question_id, triangle_id, answer_type, multiplier)
     """
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -96,30 +119,34 @@ def populate_dynamic_multipliers_from_baseline(db_path="geometry_learning.db"):
 
     baseline_data = load_initial_multipliers(db_path)
 
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.cursor()
 
     inserted_count = 0
 
-    for question_id, triangle_id, answer_text, multiplier in baseline_data:
-
-
-        answer_id = answer_mapping.get(answer_text)
-        if answer_id is None:
-            print(f"⚠️ תשובה לא מזוהה: {answer_text}")
-            continue
-
-        cursor.execute("""
-            INSERT OR IGNORE INTO DynamicAnswerMultipliers (
-                question_id, triangle_id, answer_id, baseline_multiplier,
-                dynamic_multiplier, session_count_total, session_count_with_triangle
-            ) VALUES (?, ?, ?, ?, NULL, 0, 0)
-        """, (question_id, triangle_id, answer_id, multiplier))
-
-        inserted_count += 1
-
-    conn.commit()
-    conn.close()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for question_id, triangle_id, answer_text, multiplier in baseline_data:
+            answer_id = answer_mapping.get(answer_text)
+            if answer_id is None:
+                print(f"⚠️ תשובה לא מזוהה: {answer_text}")
+                continue
+
+            cursor.execute("""
+                INSERT OR IGNORE INTO DynamicAnswerMultipliers (
+                    question_id, triangle_id, answer_id, baseline_multiplier,
+                    dynamic_multiplier, session_count_total, session_count_with_triangle
+                ) VALUES (?, ?, ?, ?, NULL, 0, 0)
+            """, (question_id, triangle_id, answer_id, multiplier))
+
+            inserted_count += 1
+
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
 
     print(f"✅ הוזנו {inserted_count} רשומות לטבלת DynamicAnswerMultipliers.")
 
@@ -128,22 +155,31 @@ def print_dynamic_table(db_path="geometry_learning.db"):
     """
     מדפיסה את תוכן הטבלה הדינאמית לבדיקת תקינות
     """
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.cursor()
 
-    cursor.execute("SELECT * FROM DynamicAnswerMultipliers")
-    rows = cursor.fetchall()
+    count = cursor.execute("SELECT COUNT(*) FROM DynamicAnswerMultipliers").fetchone()[0]
 
-    if not rows:
+    if not count:
         print("⚠️ הטבלה ריקה.")
     else:
+        cursor.arraysize = 1000
+        cursor.execute("""
+            SELECT question_id, triangle_id, answer_id, baseline_multiplier,
+                   dynamic_multiplier, session_count_total, session_count_with_triangle
+            FROM DynamicAnswerMultipliers
+        """)
         # שליפת שמות העמודות
         column_names = [description[0] for description in cursor.description]
-        print(f"\n📊 נמצאו {len(rows)} רשומות בטבלה DynamicAnswerMultipliers:\n")
+        print(f"\n📊 נמצאו {count} רשומות בטבלה DynamicAnswerMultipliers:\n")
         print(" | ".join(column_names))
         print("-" * 80)
-        for row in rows:
-            print(" | ".join(str(cell) for cell in row))
+        # הזרמה במנות של arraysize שורות – כתיבה אחת ל־stdout לכל מנה
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            sys.stdout.write("\n".join(" | ".join(map(str, row)) for row in rows) + "\n")
 
     conn.close()
 
@@ -179,21 +215,28 @@ def update_session_counts_in_dynamic_table(sessions, db_path="geometry_learning.
                 triangle_specific_counts[key] = triangle_specific_counts.get(key, 0) + 1
 
     # עדכון טבלת ה־DB לפי המונים
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.cursor()
 
     updated = 0
-    for (qid, triangle_id, aid), count in triangle_specific_counts.items():
-        total = total_counts.get((qid, aid), 0)
-        cursor.execute("""
-            UPDATE DynamicAnswerMultipliers
-            SET session_count_total = ?, session_count_with_triangle = ?
-            WHERE question_id = ? AND triangle_id = ? AND answer_id = ?
-        """, (total, count, qid, triangle_id, aid))
-        updated += 1
 
-    conn.commit()
-    conn.close()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for (qid, triangle_id, aid), count in triangle_specific_counts.items():
+            total = total_counts.get((qid, aid), 0)
+            cursor.execute("""
+                UPDATE DynamicAnswerMultipliers
+                SET session_count_total = ?, session_count_with_triangle = ?
+                WHERE question_id = ? AND triangle_id = ? AND answer_id = ?
+            """, (total, count, qid, triangle_id, aid))
+            updated += 1
+
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
 
     print(f"✅ עודכנו {updated} רשומות בטבלת DynamicAnswerMultipliers עם נתוני סשנים.")
 
@@ -212,47 +255,80 @@ def update_dynamic_multipliers_values(db_path="geometry_learning.db"):
     scale_factor = 1.5
     threshold = 10
 
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.cursor()
 
-    cursor.execute("""
-        SELECT question_id, triangle_id, answer_id,
-               baseline_multiplier, session_count_total, session_count_with_triangle
-        FROM DynamicAnswerMultipliers
-    """)
-    rows = cursor.fetchall()
-
-    updated_count = 0
-    for qid, tid, aid, baseline, total, with_triangle in rows:
-        if total < threshold or baseline in (0, 1):
-            continue
-
-        empirical = with_triangle / total
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # הסינון (סף סשנים ו־baseline שונה מ־0 ו־1) מתבצע כבר ב־SQL
+        cursor.execute("""
+            SELECT question_id, triangle_id, answer_id,
+                   baseline_multiplier, session_count_total, session_count_with_triangle
+            FROM DynamicAnswerMultipliers
+            WHERE baseline_multiplier NOT IN (0, 1) AND session_count_total >= ?
+        """, (threshold,))
+        rows = cursor.fetchall()
+
+        updated_count = 0
+        for qid, tid, aid, baseline, total, with_triangle in rows:
+            empirical = with_triangle / total
+
+            if baseline > 1:
+                target = max(1, empirical * scale_factor)
+            elif baseline < 1:
+                target = min(1, empirical * scale_factor)
+            else:
+                target = 1  # תאורטית לא נגיע לכאן כי סיננו baseline == 1
+
+            updated = baseline + alpha * (target - baseline)
+
+            # הגנה: לא להוריד אם יש התאמה מושלמת
+            if empirical == 1 and updated < baseline:
+                updated = baseline
+
+            cursor.execute("""
+                UPDATE DynamicAnswerMultipliers
+                SET dynamic_multiplier = ?
+                WHERE question_id = ? AND triangle_id = ? AND answer_id = ?
+            """, (updated, qid, tid, aid))
+
+            updated_count += 1
+
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
 
-        if baseline > 1:
-            target = max(1, empirical * scale_factor)
-        elif baseline < 1:
-            target = min(1, empirical * scale_factor)
-        else:
-            target = 1  # תאורטית לא נגיע לכאן כי סיננו baseline == 1
+    print(f"✅ עודכנו {updated_count} משקלים דינאמיים בטבלה DynamicAnswerMultipliers.")
 
-        updated = baseline + alpha * (target - baseline)
 
-        # הגנה: לא להוריד אם יש התאמה מושלמת
-        if empirical == 1 and updated < baseline:
-            updated = baseline
+##עדכון הסטטיסטיקות של מתכנן השאילתות אחרי עדכון הטבלאות
+def optimize_database(db_path="geometry_learning.db"):
+    """
+    מרעננת את הסטטיסטיקות (sqlite_stat1, ו־sqlite_stat4 אם קיים) שבהן משתמש מתכנן השאילתות.
+    מריצה ANALYZE מלא בכל הרצה: הטבלאות קטנות (מאות שורות), ו־PRAGMA optimize על חיבור חדש
+    (SQLite 3.40) לא מנתח מחדש טבלאות שהחיבור לא שאל עליהן – כך שסטטיסטיקות ישנות היו נשארות.
+    כדי לקבל היסטוגרמות (STAT4) יש לקמפל את SQLite עם SQLITE_ENABLE_STAT4.
+    """
+    conn = _connect(db_path)
+    cursor = conn.cursor()
 
-        cursor.execute("""
-            UPDATE DynamicAnswerMultipliers
-            SET dynamic_multiplier = ?
-            WHERE question_id = ? AND triangle_id = ? AND answer_id = ?
-        """, (updated, qid, tid, aid))
+    stat4 = cursor.execute("SELECT sqlite_compileoption_used('ENABLE_STAT4')").fetchone()[0]
+    print(f"ℹ️ SQLite {sqlite3.sqlite_version} – STAT4 {'זמין' if stat4 else 'לא זמין'}")
 
-        updated_count += 1
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("ANALYZE")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
 
-    conn.commit()
-    conn.close()
-    print(f"✅ עודכנו {updated_count} משקלים דינאמיים בטבלה DynamicAnswerMultipliers.")
+    print("✅ הסטטיסטיקות של מסד הנתונים עודכנו.")
 
 
 
@@ -264,6 +340,7 @@ if __name__ == "__main__":
     update_session_counts_in_dynamic_table(sessions)
     update_dynamic_multipliers_values()  # קריאה פשוטה – הערכים בפנים
     print_dynamic_table()
+    optimize_database()
 
     # print("\n📂 בדיקה שהסשנים זמינים מתוך sessions.db:")
     # preview_sessions_from_db()
@@ -1,24 +1,140 @@
 import sqlite3
-from typing import List, Dict
+import heapq
+import random
+from math import log2
+from typing import List, Dict, Optional, Tuple
 import os
 from session import Session
 from session_db import SessionDB
 from collections import defaultdict
 
+# ===== שאילתות SQL קבועות (טקסט זהה בכל קריאה → שימוש חוזר ב־statement cache) =====
+SQL_ACTIVE_THEOREM_IDS = "SELECT theorem_id FROM Theorems WHERE active = 1"
+SQL_ACTIVE_THEOREMS = "SELECT theorem_id, theorem_text, category FROM Theorems WHERE active = 1"
+SQL_THEOREMS_BY_IDS = "SELECT theorem_id, theorem_text, category FROM Theorems WHERE theorem_id IN ({placeholders})"
+SQL_EASY_QUESTIONS = """
+    SELECT question_id, question_text
+    FROM Questions
+    WHERE active = 1 AND difficulty_level = 1
+"""
+SQL_ACTIVE_QUESTIONS = "SELECT question_id, question_text FROM Questions WHERE active = 1"
+SQL_PREREQUISITES = "SELECT prerequisite_question_id, dependent_question_id FROM QuestionPrerequisites"
+SQL_ALL_MULTIPLIERS = """
+    SELECT question_id, triangle_id, answer_id,
+           COALESCE(dynamic_multiplier, baseline_multiplier) AS multiplier
+    FROM DynamicAnswerMultipliers
+    ORDER BY question_id, triangle_id, answer_id
+"""
+SQL_ANSWER_MULTIPLIERS = """
+    SELECT triangle_id,
+           COALESCE(dynamic_multiplier, baseline_multiplier) AS multiplier
+    FROM DynamicAnswerMultipliers
+    WHERE question_id = ? AND answer_id = ?
+"""
+SQL_TRIANGLE_MATRIX = """
+    SELECT theorem_id, triangle_id, connection_strength
+    FROM TheoremTriangleMatrix
+    ORDER BY theorem_id, triangle_id
+"""
+SQL_GENERAL_HELPFULNESS = "SELECT theorem_id, general_helpfulness FROM TheoremGeneralHelpfulness"
+SQL_THEOREM_SCORES = """
+    SELECT theorem_id, score
+    FROM TheoremScores
+    WHERE question_id = ? AND answer_id = ?
+"""
+
+# PRAGMA לכל חיבור: מטמון דפים גדול, טבלאות זמניות בזיכרון ו־WAL
+CONNECTION_PRAGMAS = (
+    "PRAGMA cache_size = -20000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA journal_mode = WAL",
+)
+
+def _ent4(a: float, b: float, c: float, d: float) -> float:
+    """אנטרופיה של התפלגות על ארבעת סוגי המשולשים (0–3) – פרוסה, ללא רשימה ולולאה."""
+    s = 0.0
+    if a > 0:
+        s -= a * log2(a)
+    if b > 0:
+        s -= b * log2(b)
+    if c > 0:
+        s -= c * log2(c)
+    if d > 0:
+        s -= d * log2(d)
+    return s
+
+
 class GeometryManager:
-    def __init__(self, db_path="geometry_learning.db"):
+    # שמות סוגי המשולשים לפי triangle_id (משמש גם לקטגוריית המשפט)
+    TRIANGLE_NAMES = {0: "כללי", 1: "שווה צלעות", 2: "שווה שוקיים", 3: "ישר זווית"}
+
+    def __init__(self, db_path="geometry_learning.db", conn=None):
+        """
+        conn – חיבור קיים (אופציונלי), למשל עותק בזיכרון של המסד לבדיקות;
+        אחרת נפתח חיבור חדש ל־db_path.
+        """
         self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = conn if conn is not None else sqlite3.connect(self.db_path, isolation_level="DEFERRED")
         self.conn.row_factory = sqlite3.Row  # מאפשר גישה נוחה לעמודות לפי שם
+        for pragma in CONNECTION_PRAGMAS:
+            self.conn.execute(pragma)
+        self._cur = self.conn.cursor()  # קורסור אחד לכל חיי המנהל
+        # ===== מטמון לטבלאות הדירוג (נטען פעם אחת, בשימוש הראשון) =====
+        self._tri_matrix = None  # theorem_id -> [(triangle_id, connection_strength), ...]
+        self._gen_help = None  # theorem_id -> general_helpfulness
+        self._theorem_scores = {}  # (question_id, answer_id, theorem_id) -> score
+        self._loaded_score_pairs = set()  # צירופי (question_id, answer_id) שכבר נטענו
+        self._prereq_map = None  # dependent_question_id -> {prerequisite_question_id, ...}
+        self._all_active_questions = None  # [(question_id, question_text), ...]
+        self._theorem_meta = None  # theorem_id -> (theorem_text, category) למשפטים הפעילים
+        self._strong_connections = None  # [(theorem_id, ((triangle_id, strength), ...)), ...]
         self.state = self._initialize_state()
-        self.session = Session()
-        self.session_db = SessionDB()
+        # Session ו־SessionDB נוצרים רק בשימוש הראשון (ראו המאפיינים למטה)
+        self._session = None
+        self._session_db = None
         # ===== Back-to-exercise support =====
         self._pending_question = None  # תשמר כאן השאלה האחרונה שהוצגה למשתמש ועדיין ממתינה לתשובה
         self._resume_requested = False  # דגל: האם המשתמש ביקש "חזרה לתרגיל"
 
     def close(self):
         self.conn.close()
+        if self._session_db is not None:
+            self._session_db.close()
+
+    @property
+    def state(self) -> Dict:
+        """המצב הפנימי של הסשן (משקלים, שאלות שנשאלו וכו')."""
+        return self._state
+
+    @state.setter
+    def state(self, value: Dict):
+        # מצב יכול להיות משוחזר מבחוץ (למשל ב־API) – בונים מחדש את קבוצת השאלות שנשאלו
+        self._state = value
+        self._asked_set = set(value['asked_questions'])
+
+    def _mark_asked(self, question_id: int):
+        """רושמת שאלה כנשאלה – גם ברשימה שבמצב וגם בקבוצה לבדיקת שייכות מהירה."""
+        self._state['asked_questions'].append(question_id)
+        self._asked_set.add(question_id)
+
+    @property
+    def session(self) -> Session:
+        """מסלול הסשן הנוכחי – נוצר בגישה הראשונה."""
+        if self._session is None:
+            self._session = Session()
+        return self._session
+
+    @session.setter
+    def session(self, value: Session):
+        self._session = value
+
+    @property
+    def session_db(self) -> SessionDB:
+        """חיבור למסד הסשנים – נפתח רק כשצריך לשמור סשן."""
+        if self._session_db is None:
+            self._session_db = SessionDB()
+        return self._session_db
 
     def _initialize_state(self) -> Dict:
         """אתחול מצב פנימי - משקלים התחלתיים וכו'"""
@@ -36,28 +152,21 @@ class GeometryManager:
 
     def _initialize_theorem_weights(self) -> Dict[int, float]:
         """Initialize all active theorems with minimal base weight."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT theorem_id FROM Theorems WHERE active = 1")
-        return {theorem[0]: 0.01 for theorem in cursor.fetchall()}
+        self._cur.execute(SQL_ACTIVE_THEOREM_IDS)
+        return {theorem[0]: 0.01 for theorem in self._cur.fetchall()}
 
     def get_first_question(self) -> Dict:
         """בחר שאלה ראשונה מתוך שאלות קלות ועדכן את ההיסטוריה."""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT question_id, question_text 
-            FROM Questions 
-            WHERE active = 1 AND difficulty_level = 1
-        """)
-        easy_questions = cursor.fetchall()
+        self._cur.execute(SQL_EASY_QUESTIONS)
+        easy_questions = self._cur.fetchall()
 
         if not easy_questions:
             return {"error": "No easy questions found."}
 
-        import random
         selected = random.choice(easy_questions)
         question_id, question_text = selected["question_id"], selected["question_text"]
 
-        self.state['asked_questions'].append(question_id)
+        self._mark_asked(question_id)
         self.state['questions_count'] += 1
 
         return {
@@ -90,78 +199,118 @@ class GeometryManager:
         print("📊 מצב פנימי נוכחי:")
         print(self.state)
 
-    def _calculate_entropy(self, probabilities: List[float]) -> float:
-        """חישוב אנטרופיה לפי התפלגות הסתברויות."""
-        import math
-        return -sum(p * math.log2(p) for p in probabilities if p > 0)
+    def _get_triangle_vector(self) -> List[float]:
+        """מחזירה עותק של משקלי המשולשים כרשימה באורך קבוע, לפי אינדקס triangle_id (0–3)."""
+        triangle_weights = self.state['triangle_weights']
+        return [triangle_weights[tid] for tid in range(len(triangle_weights))]
+
+    def _get_theorem_meta(self) -> Dict[int, Tuple[str, int]]:
+        """טוענת פעם אחת את הטקסט והקטגוריה של כל המשפטים הפעילים."""
+        if self._theorem_meta is None:
+            self._cur.execute(SQL_ACTIVE_THEOREMS)
+            self._theorem_meta = {
+                theorem_id: (theorem_text, category)
+                for theorem_id, theorem_text, category in self._cur.fetchall()
+            }
+        return self._theorem_meta
+
+    def _get_active_questions(self) -> List[Tuple[int, str]]:
+        """טוענת פעם אחת את רשימת השאלות הפעילות: [(question_id, question_text), ...]"""
+        if self._all_active_questions is None:
+            self._cur.execute(SQL_ACTIVE_QUESTIONS)
+            self._all_active_questions = [(qid, qtext) for qid, qtext in self._cur.fetchall()]
+        return self._all_active_questions
 
-    def _calculate_question_relevance_score(self, question_id: int, triangle_weights: Dict[int, float]) -> float:
+    def _get_prereq_map(self) -> Dict[int, set]:
+        """
+        טוענת פעם אחת את טבלת QuestionPrerequisites ובונה מיפוי
+        dependent_question_id -> קבוצת שאלות הקדם שלה. הטבלה קבועה במהלך סשן.
+        """
+        if self._prereq_map is None:
+            self._cur.execute(SQL_PREREQUISITES)
+            prerequisite_map = {}
+            for prereq_id, dep_id in self._cur.fetchall():
+                prerequisite_map.setdefault(dep_id, set()).add(prereq_id)
+            self._prereq_map = prerequisite_map
+        return self._prereq_map
+
+    def _load_all_multipliers(self) -> Tuple[Dict[int, List[Tuple[int, int, float]]],
+                                             Dict[int, Dict[int, List[Tuple[int, float]]]]]:
+        """
+        שולפת בשאילתה אחת את כל המכפילים (דינאמי אם קיים, אחרת בייסליין)
+        ומקבצת אותם באותו מעבר בשתי צורות:
+        - לפי שאלה: question_id -> [(triangle_id, answer_id, multiplier), ...]
+        - לפי שאלה ותשובה: question_id -> {answer_id: [(triangle_id, multiplier), ...]}
+          (הקיבוץ שרווח המידע צריך – כדי לא לבנות אותו מחדש לכל שאלה)
+        """
+        self._cur.execute(SQL_ALL_MULTIPLIERS)
+
+        multipliers_by_question = {}
+        answer_groups_by_question = {}
+        for question_id, triangle_id, answer_id, multiplier in self._cur.fetchall():
+            multipliers_by_question.setdefault(question_id, []).append((triangle_id, answer_id, multiplier))
+            answer_groups_by_question.setdefault(question_id, {}).setdefault(answer_id, []).append(
+                (triangle_id, multiplier))
+        return multipliers_by_question, answer_groups_by_question
+
+    @staticmethod
+    def _get_active_triangles(triangle_weights: Dict[int, float]) -> set:
+        """סוגי המשולשים שמשקלם עדיין משמעותי (מעל 0.05)."""
+        return {tid for tid, weight in triangle_weights.items() if weight > 0.05}
+
+    def _calculate_question_relevance_score(self, question_id: int, triangle_weights: Dict[int, float],
+                                            rows: List[Tuple[int, int, float]],
+                                            active_triangles: set = None) -> float:
         """
         מחשבת עד כמה השאלה רלוונטית לפי המשקלים הנוכחיים של סוגי המשולשים,
         תוך שימוש במכפילים דינאמיים אם קיימים, אחרת בבייסליין.
+        rows – המכפילים של השאלה כפי שחוזרים מ־_load_all_multipliers().
+        active_triangles – אופציונלי, כדי לא לחשב אותם מחדש לכל שאלה.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT triangle_id, answer_id, COALESCE(dynamic_multiplier, baseline_multiplier) AS multiplier
-            FROM DynamicAnswerMultipliers
-            WHERE question_id = ?
-        """, (question_id,))
+        if active_triangles is None:
+            active_triangles = self._get_active_triangles(triangle_weights)
 
         max_impact = 0
-        active_triangles = {tid for tid, weight in triangle_weights.items() if weight > 0.05}
-
-        for row in cursor.fetchall():
-            triangle_id = row["triangle_id"]
-            multiplier = row["multiplier"]
-
+        for triangle_id, answer_id, multiplier in rows:
             if triangle_id in active_triangles:
-                current_weight = triangle_weights[triangle_id]
-                potential_change = abs(current_weight * multiplier - current_weight)
-                max_impact = max(max_impact, potential_change)
+                # |w*m - w| == w*|m - 1| (המשקלים אינם שליליים)
+                potential_change = triangle_weights[triangle_id] * abs(multiplier - 1)
+                if potential_change > max_impact:
+                    max_impact = potential_change
 
         return max_impact
 
-    def _calculate_information_gain(self, question_id: int) -> float:
+    def _calculate_information_gain(self, question_id: int,
+                                    answer_groups: Dict[int, List[Tuple[int, float]]]) -> float:
         """
         מחשב רווח מידע של שאלה לפי שינוי באנטרופיה,
         תוך שימוש במכפילים דינאמיים אם קיימים, אחרת בבייסליין.
+        answer_groups – המכפילים של השאלה מקובצים לפי תשובה, כפי שחוזרים מ־_load_all_multipliers().
         """
-        current_weights = self.state['triangle_weights']
-        current_entropy = self._calculate_entropy(list(current_weights.values()))
-
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT triangle_id, answer_id, COALESCE(dynamic_multiplier, baseline_multiplier) AS multiplier
-            FROM DynamicAnswerMultipliers
-            WHERE question_id = ?
-        """, (question_id,))
-
-        # ארגון לפי תשובה מספרית
-        answer_groups = {}
-        for triangle_id, answer_id, multiplier in cursor.fetchall():
-            if answer_id not in answer_groups:
-                answer_groups[answer_id] = []
-            answer_groups[answer_id].append((triangle_id, multiplier))
+        weights = self._get_triangle_vector()
+        w0, w1, w2, w3 = weights  # המערכת מוגדרת בדיוק על ארבעה סוגי משולשים
+        current_entropy = _ent4(w0, w1, w2, w3)
 
         expected_entropy = 0
         total_weight = 0
 
         for answer_id, multipliers in answer_groups.items():
-            simulated_weights = current_weights.copy()
+            simulated_weights = [w0, w1, w2, w3]
+            # הערכת הסתברות לקבלת תשובה זו לפי משקלי המשולשים
+            prob = 0
 
             for triangle_id, multiplier in multipliers:
                 simulated_weights[triangle_id] *= multiplier
+                prob += weights[triangle_id] * multiplier
 
             # נרמול
-            total = sum(simulated_weights.values())
+            a, b, c, d = simulated_weights
+            total = a + b + c + d
             if total > 0:
-                for tid in simulated_weights:
-                    simulated_weights[tid] /= total
+                a, b, c, d = a / total, b / total, c / total, d / total
 
-            entropy = self._calculate_entropy(list(simulated_weights.values()))
+            entropy = _ent4(a, b, c, d)
 
-            # הערכת הסתברות לקבלת תשובה זו לפי משקלי המשולשים
-            prob = sum(current_weights[tid] * mult for tid, mult in multipliers)
             expected_entropy += prob * entropy
             total_weight += prob
 
@@ -253,27 +402,21 @@ class GeometryManager:
         בוחרת את השאלה הבאה בהתבסס על משקלי המשולשים, רווח מידע ורלוונטיות,
         תוך כיבוד אילוצי הקדימויות מתוך טבלת QuestionPrerequisites.
         """
-        cursor = self.conn.cursor()
         state = self.state
 
         # שלב א: אם לא נשאלה אף שאלה – בחר שאלה קלה באקראי
         if len(state['asked_questions']) == 0:
-            cursor.execute("""
-                SELECT question_id, question_text
-                FROM Questions
-                WHERE difficulty_level = 1 AND active = 1
-            """)
-            easy_questions = cursor.fetchall()
+            self._cur.execute(SQL_EASY_QUESTIONS)
+            easy_questions = self._cur.fetchall()
 
             if not easy_questions:
                 return {"error": "No easy questions found."}
 
-            import random
             selected = random.choice(easy_questions)
             question_id, question_text = selected
 
             # עדכון מצב פנימי
-            state['asked_questions'].append(question_id)
+            self._mark_asked(question_id)
             state['questions_count'] += 1
 
             return {
@@ -282,28 +425,20 @@ class GeometryManager:
                 "info": "שאלה ראשונה נבחרה באקראי"
             }
 
-        # שלב ב: שליפת כל השאלות הפעילות
-        cursor.execute("""
-            SELECT question_id, question_text
-            FROM Questions
-            WHERE active = 1
-        """)
-        all_questions = cursor.fetchall()
-
-        # שלב ג: שליפת אילוצי קדימות
-        cursor.execute("""
-            SELECT prerequisite_question_id, dependent_question_id
-            FROM QuestionPrerequisites
-        """)
-        prerequisites = cursor.fetchall()
-        prerequisite_map = {}
-        for prereq_id, dep_id in prerequisites:
-            prerequisite_map.setdefault(dep_id, set()).add(prereq_id)
-
-        # שלב ד: חישוב ציונים רק לשאלות שאינן נשאלו ושאין להן תנאי קדימות פתוחים
-        scores = {}
+        # שלב ב: כל השאלות הפעילות (נטענות פעם אחת)
+        all_questions = self._get_active_questions()
+
+        # שלב ג: אילוצי קדימות (נטענים פעם אחת)
+        prerequisite_map = self._get_prereq_map()
+
+        # שלב ד: חישוב ציונים רק לשאלות שאינן נשאלו ושאין להן תנאי קדימות פתוחים,
+        # תוך מעקב אחר השאלה עם הציון הגבוה ביותר (ציון חיובי בלבד) במעבר אחד
+        best_qid, best_text, best_score = None, None, 0
         triangle_weights = state['triangle_weights']
-        asked_ids = set(state['asked_questions'])
+        asked_ids = self._asked_set  # מתוחזקת יחד עם state['asked_questions']
+        active_triangles = self._get_active_triangles(triangle_weights)
+        # שאילתה אחת לכל השאלות
+        multipliers_by_question, answer_groups_by_question = self._load_all_multipliers()
 
         for qid, qtext in all_questions:
             if qid in asked_ids:
@@ -314,22 +449,20 @@ class GeometryManager:
             if not required.issubset(asked_ids):
                 continue  # יש תנאי קדימות שעדיין לא התקיימו
 
-            relevance = self._calculate_question_relevance_score(qid, triangle_weights)
-            info_gain = self._calculate_information_gain(qid)
+            rows = multipliers_by_question.get(qid, [])
+            relevance = self._calculate_question_relevance_score(qid, triangle_weights, rows, active_triangles)
+            info_gain = self._calculate_information_gain(qid, answer_groups_by_question.get(qid, {}))
 
             score = relevance * info_gain
-            if score > 0:
-                scores[qid] = (score, qtext)
+            if score > best_score:
+                best_qid, best_text, best_score = qid, qtext, score
 
-        # שלב ה: בחירה בשאלה עם הציון הגבוה ביותר
-        if not scores:
+        # שלב ה: השאלה עם הציון הגבוה ביותר
+        if best_qid is None:
             return {"error": "לא נמצאה שאלה מתאימה שעומדת בתנאי הקדימות וברלוונטיות."}
 
-        best_qid = max(scores, key=lambda k: scores[k][0])
-        best_text = scores[best_qid][1]
-
         # עדכון מצב פנימי
-        state['asked_questions'].append(best_qid)
+        self._mark_asked(best_qid)
         state['questions_count'] += 1
 
         return {
@@ -343,22 +476,23 @@ class GeometryManager:
         מעבד תשובה של המשתמש לשאלה מסוימת ומעדכן את משקלי המשולשים והמשפטים.
         מדפיס את המשפטים הרלוונטיים לאחר עדכון.
         """
-        self._update_triangle_weights(question_id, answer_id)
-        self._update_theorem_weights()
+        # כל השאילתות של עיבוד התשובה רצות בטרנזקציה אחת (נעילה ו־snapshot אחד)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self._update_triangle_weights(question_id, answer_id)
+            self._update_theorem_weights()
+            relevant_theorems = self.get_relevant_theorems(question_id, answer_id)
         self.session.add_interaction(question_id, answer_id)
 
         # ✅ הדפסת משקלי המשולשים
         print("\n📐 משקלי המשולשים לאחר העדכון:")
-        triangle_names = {0: "כללי", 1: "שווה צלעות", 2: "שווה שוקיים", 3: "ישר זווית"}
         for tid, weight in self.state['triangle_weights'].items():
-            print(f"🔸 {triangle_names.get(tid, 'לא ידוע')} ({tid}): {weight:.3f}")
+            print(f"🔸 {self.TRIANGLE_NAMES.get(tid, 'לא ידוע')} ({tid}): {weight:.3f}")
 
         # ✅ הדפסת המשפטים הרלוונטיים
-        relevant_theorems = self.get_relevant_theorems(question_id, answer_id)
         print("\n📌 משפטים רלוונטיים לאחר העדכון:")
-        triangle_types = {0: "כללי", 1: "שווה צלעות", 2: "שווה שוקיים", 3: "ישר זווית"}
         for th in relevant_theorems:
-            category_name = triangle_types.get(th["category"], "לא ידוע")
+            category_name = self.TRIANGLE_NAMES.get(th["category"], "לא ידוע")
             print(
                 f"🔹 [{th['theorem_id']}] {th['theorem_text']} (סוג: {category_name}, ציון: {th['combined_score']:.3f})")
 
@@ -418,43 +552,55 @@ class GeometryManager:
         """
         state = self.state
         num_questions = state['questions_count']
-        cursor = self.conn.cursor()
+
+        theorem_meta = self._get_theorem_meta()
 
         # שלב 1: אם זו השאלה הראשונה – מחזירים את כל המשפטים הפעילים עם משקל בסיסי
         if num_questions == 1:
-            cursor.execute("SELECT theorem_id, theorem_text, category FROM Theorems WHERE active = 1")
-            all_theorems = cursor.fetchall()
             return [
                 {
-                    "theorem_id": row["theorem_id"],
-                    "theorem_text": row["theorem_text"],
+                    "theorem_id": theorem_id,
+                    "theorem_text": theorem_text,
                     "weight": 0.01,
-                    "category": row["category"]
+                    "category": category
                 }
-                for row in all_theorems
+                for theorem_id, (theorem_text, category) in theorem_meta.items()
             ]
 
         # שלב 2: קביעת סף סינון דינאמי
         increment_factor = 0.05
         threshold = base_threshold + (num_questions * increment_factor)
 
-        # שלב 3: שליפת משפטים שמשקלם מעל הסף
+        # שלב 3: סינון משפטים שמשקלם מעל הסף – הטקסט והקטגוריה מגיעים מהמטמון
+        passing = [(theorem_id, weight) for theorem_id, weight in state['theorem_weights'].items()
+                   if weight >= threshold]
+
+        # משפטים שאינם פעילים לא נמצאים במטמון – שליפה אחת לכולם עם IN (...)
+        missing_ids = [theorem_id for theorem_id, _ in passing if theorem_id not in theorem_meta]
+        extra_meta = {}
+        if missing_ids:
+            self._cur.execute(
+                SQL_THEOREMS_BY_IDS.format(placeholders=",".join("?" * len(missing_ids))),
+                missing_ids
+            )
+            extra_meta = {
+                theorem_id: (theorem_text, category)
+                for theorem_id, theorem_text, category in self._cur.fetchall()
+            }
+
         result = []
-        for theorem_id, weight in state['theorem_weights'].items():
-            if weight >= threshold:
-                cursor.execute("""
-                    SELECT theorem_text, category 
-                    FROM Theorems 
-                    WHERE theorem_id = ?
-                """, (theorem_id,))
-                row = cursor.fetchone()
-                if row:
-                    result.append({
-                        "theorem_id": theorem_id,
-                        "theorem_text": row["theorem_text"],
-                        "weight": weight,
-                        "category": row["category"]
-                    })
+        for theorem_id, weight in passing:
+            meta = theorem_meta.get(theorem_id)
+            if meta is None:
+                meta = extra_meta.get(theorem_id)
+                if meta is None:
+                    continue
+            result.append({
+                "theorem_id": theorem_id,
+                "theorem_text": meta[0],
+                "weight": weight,
+                "category": meta[1]
+            })
 
         return result
 
@@ -462,26 +608,59 @@ class GeometryManager:
 
 
 
+    ## טעינת טבלאות הדירוג לזיכרון
+    def _get_triangle_matrix(self) -> Dict[int, List[Tuple[int, float]]]:
+        """טוענת פעם אחת את TheoremTriangleMatrix למילון theorem_id -> [(triangle_id, strength)]."""
+        if self._tri_matrix is None:
+            self._cur.execute(SQL_TRIANGLE_MATRIX)
+            matrix = {}
+            for theorem_id, triangle_id, strength in self._cur.fetchall():
+                matrix.setdefault(theorem_id, []).append((triangle_id, strength))
+            self._tri_matrix = matrix
+        return self._tri_matrix
+
+    def _get_strong_connections(self) -> List[Tuple[int, Tuple[Tuple[int, float], ...]]]:
+        """
+        מחשבת פעם אחת, מתוך TheoremTriangleMatrix, את החיבורים החזקים (>= 0.9) של כל משפט.
+        משפטים ללא חיבור חזק לא נכללים – בדיוק כמו בעדכון משקלי המשפטים.
+        """
+        if self._strong_connections is None:
+            strong = []
+            for theorem_id, connections in self._get_triangle_matrix().items():
+                # מתעלמים מחיבורים חלשים
+                kept = tuple((tid, strength) for tid, strength in connections if strength >= 0.9)
+                if kept:
+                    strong.append((theorem_id, kept))
+            self._strong_connections = strong
+        return self._strong_connections
+
+    def _get_general_helpfulness_map(self) -> Dict[int, float]:
+        """טוענת פעם אחת את TheoremGeneralHelpfulness למילון theorem_id -> general_helpfulness."""
+        if self._gen_help is None:
+            self._cur.execute(SQL_GENERAL_HELPFULNESS)
+            self._gen_help = {theorem_id: value for theorem_id, value in self._cur.fetchall()}
+        return self._gen_help
+
+    def _load_theorem_scores(self, question_id: int, answer_id: int):
+        """טוענת בשאילתה אחת את ערכי score של כל המשפטים עבור צירוף שאלה-תשובה."""
+        pair = (question_id, answer_id)
+        if pair in self._loaded_score_pairs:
+            return
+        self._cur.execute(SQL_THEOREM_SCORES, pair)
+        for theorem_id, score in self._cur.fetchall():
+            self._theorem_scores[(question_id, answer_id, theorem_id)] = score
+        self._loaded_score_pairs.add(pair)
+
     ## לצורך הצגת המשפטים עם דירוג חכם - חישוב משקל המשולש בהתאם למצב בסשן
     def get_triangle_score(self, theorem_id: int) -> float:
         """
         מחשבת את ציון ההתאמה בין משפט לבין התפלגות המשולשים הנוכחית,
         לפי עוצמות קשר בטבלת TheoremTriangleMatrix.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT triangle_id, connection_strength
-            FROM TheoremTriangleMatrix
-            WHERE theorem_id = ?
-        """, (theorem_id,))
-        rows = cursor.fetchall()
-
         triangle_weights = self.state['triangle_weights']
         score = 0.0
 
-        for row in rows:
-            triangle_id = row["triangle_id"]
-            strength = row["connection_strength"]
+        for triangle_id, strength in self._get_triangle_matrix().get(theorem_id, ()):
             weight = triangle_weights.get(triangle_id, 0)
             score += strength * weight
 
@@ -492,50 +671,49 @@ class GeometryManager:
         מחזירה את ערך score מטבלת TheoremScores עבור שאלה, תשובה ומשפט נתונים.
         הנחה: כל הצירופים קיימים בטבלה.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT score
-            FROM TheoremScores
-            WHERE question_id = ? AND answer_id = ? AND theorem_id = ?
-        """, (question_id, answer_id, theorem_id))
-        row = cursor.fetchone()
-        return row["score"]
+        self._load_theorem_scores(question_id, answer_id)
+        return self._theorem_scores[(question_id, answer_id, theorem_id)]
 ##לצורך הצגת המשפטים בדירוג חכם - שליפת ערך התרומה הכללית של המשפט
     def get_general_helpfulness(self, theorem_id: int) -> float:
         """
         מחזירה את ערך general_helpfulness של משפט מסוים מתוך הטבלה TheoremGeneralHelpfulness.
         הנחה: כל המשפטים קיימים בטבלה (1–63), ולכן אין צורך בערך ברירת מחדל.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT general_helpfulness
-            FROM TheoremGeneralHelpfulness
-            WHERE theorem_id = ?
-        """, (theorem_id,))
-        row = cursor.fetchone()
-        return row["general_helpfulness"]
+        return self._get_general_helpfulness_map()[theorem_id]
 #מיון המשפטים שהתקבלו בסדר חכם
-    def _sort_theorems_by_combined_score(self, theorems: List[Dict], question_id: int, answer_id: int) -> List[Dict]:
+    def _sort_theorems_by_combined_score(self, theorems: List[Dict], question_id: int, answer_id: int,
+                                         top_k: Optional[int] = None) -> List[Dict]:
         """
         מקבלת רשימת משפטים (כפי שחוזרת מ־_get_list_of_relevant_theorems) ומחזירה אותם ממוינים
         לפי שקלול משוקלל של:
         - התאמה למשולשים (triangle score)
         - score לפי שאלה-תשובה-משפט
         - general_helpfulness
+        אם top_k הוגדר – מוחזרים רק top_k המשפטים המובילים (ללא מיון מלא).
         """
         # 🧮 הגדרת המשקולות (מודולרי)
         W1 = 0.7  # משקל להתאמה למשולשים
         W2 = 0.2  # משקל ל־score מתוך TheoremScores
         W3 = 0.1  # משקל ל־general_helpfulness מתוך TheoremGeneralHelpfulness
 
+        # שליפת המטמונים למשתנים מקומיים פעם אחת – הלולאה עצמה חישובית בלבד
+        triangle_weights = self.state['triangle_weights']
+        tri_matrix = self._get_triangle_matrix()
+        gen_help = self._get_general_helpfulness_map()
+        self._load_theorem_scores(question_id, answer_id)
+        theorem_scores = self._theorem_scores
+
         scored_theorems = []
 
         for th in theorems:
             tid = th["theorem_id"]
 
-            triangle_score = self.get_triangle_score(tid)
-            theorem_score = self.get_theorem_score(question_id, answer_id, tid)
-            general_helpfulness = self.get_general_helpfulness(tid)
+            # זהה ל־get_triangle_score, ללא קריאת מתודה לכל משפט
+            triangle_score = 0.0
+            for triangle_id, strength in tri_matrix.get(tid, ()):
+                triangle_score += strength * triangle_weights.get(triangle_id, 0)
+            theorem_score = theorem_scores[(question_id, answer_id, tid)]
+            general_helpfulness = gen_help[tid]
 
             combined_score = (
                     W1 * triangle_score +
@@ -549,12 +727,16 @@ class GeometryManager:
             scored_theorems.append(th_with_score)
 
         # מיון לפי הציון המשוקלל מהגבוה לנמוך
+        if top_k is not None:
+            # בחירה חלקית: O(T log K) במקום מיון מלא, באותו סדר בדיוק כמו sorted(...)[:top_k]
+            return heapq.nlargest(top_k, scored_theorems, key=lambda x: x["combined_score"])
         return sorted(scored_theorems, key=lambda x: x["combined_score"], reverse=True)
 
 
 
     ##החדשה
-    def get_relevant_theorems(self, question_id: int, answer_id: int, base_threshold: float = 0.01) -> List[Dict]:
+    def get_relevant_theorems(self, question_id: int, answer_id: int, base_threshold: float = 0.01,
+                              top_k: Optional[int] = None) -> List[Dict]:
         """
         מחזירה את רשימת המשפטים הרלוונטיים, ממוינת לפי ציון משוקלל שמבוסס על:
         - התאמה למשולשים (triangle score)
@@ -562,9 +744,10 @@ class GeometryManager:
         - general_helpfulness
 
         נדרשים question_id ו־answer_id לצורך חישוב הציון.
+        top_k (אופציונלי) – מגביל את התוצאה ל־top_k המשפטים המובילים.
         """
         theorems = self._get_list_of_relevant_theorems(base_threshold=base_threshold)
-        sorted_theorems = self._sort_theorems_by_combined_score(theorems, question_id, answer_id)
+        sorted_theorems = self._sort_theorems_by_combined_score(theorems, question_id, answer_id, top_k=top_k)
         return sorted_theorems
 
     def _update_triangle_weights(self, question_id: int, answer_id: int):
@@ -572,62 +755,40 @@ class GeometryManager:
         עדכון משקלי המשולשים לפי התשובה שהתקבלה,
         תוך שימוש במכפילים דינאמיים אם קיימים, אחרת בבייסליין.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT triangle_id,
-                   COALESCE(dynamic_multiplier, baseline_multiplier) AS multiplier
-            FROM DynamicAnswerMultipliers
-            WHERE question_id = ? AND answer_id = ?
-        """, (question_id, answer_id))
+        self._cur.execute(SQL_ANSWER_MULTIPLIERS, (question_id, answer_id))
 
-        multipliers = cursor.fetchall()
+        multipliers = self._cur.fetchall()
         if not multipliers:
             print(f"⚠️ לא נמצאו מכפילים לשאלה {question_id} ולתשובה {answer_id}")
             return
 
-        current_weights = self.state['triangle_weights']
-        new_weights = current_weights.copy()
+        new_weights = self._get_triangle_vector()
 
         for triangle_id, multiplier in multipliers:
             new_weights[triangle_id] *= multiplier
 
         # נרמול המשקלים כך שסכומם יהיה 1
-        total = sum(new_weights.values())
+        w0, w1, w2, w3 = new_weights
+        total = w0 + w1 + w2 + w3
         if total > 0:
-            for tid in new_weights:
-                new_weights[tid] /= total
+            w0, w1, w2, w3 = w0 / total, w1 / total, w2 / total, w3 / total
 
-        self.state['triangle_weights'] = new_weights
+        # במצב (state) נשמר מילון triangle_id -> weight, כפי שה־API מחזיר אותו
+        self.state['triangle_weights'] = {0: w0, 1: w1, 2: w2, 3: w3}
 
     def _update_theorem_weights(self):
         """
         עדכון משקלי המשפטים לפי משקלי המשולשים, לפי טבלת TheoremTriangleMatrix.
         """
-        cursor = self.conn.cursor()
         triangle_weights = self.state['triangle_weights']
 
-        cursor.execute("""
-            SELECT theorem_id, triangle_id, connection_strength 
-            FROM TheoremTriangleMatrix
-        """)
-        rows = cursor.fetchall()
-
         new_weights = {}
 
-        for row in rows:
-            theorem_id = row['theorem_id']
-            triangle_id = row['triangle_id']
-            strength = row['connection_strength']
-
-            if strength < 0.9:
-                continue  # מתעלמים מחיבורים חלשים
-
-            weight = triangle_weights.get(triangle_id, 0) * strength
-
-            if theorem_id not in new_weights:
-                new_weights[theorem_id] = 0
-
-            new_weights[theorem_id] += weight
+        for theorem_id, connections in self._get_strong_connections():
+            weight = 0
+            for triangle_id, strength in connections:
+                weight += triangle_weights.get(triangle_id, 0) * strength
+            new_weights[theorem_id] = weight
 
         self.state['theorem_weights'] = new_weights
 
@@ -2,25 +2,53 @@ import json
 import uuid
 from typing import List
 
+try:
+    import orjson  # קידוד JSON מהיר (C) – אופציונלי
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack  # אופציונלי – לשמירה בינארית במסד הנתונים
+except ImportError:
+    msgpack = None
+
 class Session:
+    # ללא __dict__ לכל מופע – אובייקט קטן יותר וגישה מהירה יותר לשדות
+    __slots__ = ("session_id", "interactions", "feedback", "helpful_theorems", "triangle_type")
+
+    # גרסת פורמט השמירה במסד: 2 – אינטראקציות כזוגות [question_id, answer_id]
+    # (גרסה 1, ללא המפתח "v", שמרה כל אינטראקציה כמילון {"question_id", "answer_id"})
+    STORAGE_VERSION = 2
+
     def __init__(self, session_id=None):
         self.session_id = session_id if session_id else str(uuid.uuid4())
-        self.interactions = []  # רשימת מזהי השאלות והתשובות
+        self.interactions = []  # רשימת זוגות (question_id, answer_id)
         self.feedback = None  # משוב בסוף המסלול
         self.helpful_theorems = []  # מזהים של משפטים שסייעו למשתמש
         self.triangle_type = None # סוג המשולש שהיה בפועל כקלט מהמשתמש
 
     def add_interaction(self, question_id, answer_id):
         """מוסיף מזהה של שאלה ותשובה למסלול"""
-        self.interactions.append({"question_id": question_id, "answer_id": answer_id})
+        self.interactions.append((question_id, answer_id))
 
     def set_feedback(self, feedback_id):
         """שומר את מזהה המשוב בסוף המסלול"""
         self.feedback = feedback_id
 
     def to_dict(self):
-        """ממיר את המסלול למבנה JSON לשמירה"""
+        """ממיר את המסלול למבנה JSON מפורט (אינטראקציות כמילונים) – לתגובות ה־API"""
         return {
+            "session_id": self.session_id,
+            "interactions": [{"question_id": q, "answer_id": a} for q, a in self.interactions],
+            "feedback": self.feedback,
+            "triangle_type": self.triangle_type,
+            "helpful_theorems": self.helpful_theorems
+        }
+
+    def _to_payload(self):
+        """מבנה השמירה במסד (גרסה STORAGE_VERSION) – אינטראקציות כזוגות, ללא שמות מפתחות"""
+        return {
+            "v": self.STORAGE_VERSION,
             "session_id": self.session_id,
             "interactions": self.interactions,
             "feedback": self.feedback,
@@ -29,9 +57,21 @@ class Session:
         }
 
     def to_json(self):
-        """ממיר את המסלול למחרוזת JSON"""
+        """ממיר את המסלול למחרוזת JSON במבנה המפורט של to_dict (עם orjson אם זמין) – לפלט חיצוני"""
+        if orjson is not None:
+            return orjson.dumps(self.to_dict()).decode()
         return json.dumps(self.to_dict(), ensure_ascii=False)
 
+    def _to_storage_json(self):
+        """ממיר את המסלול למחרוזת JSON בפורמט השמירה (כשאין msgpack)"""
+        if orjson is not None:
+            return orjson.dumps(self._to_payload()).decode()
+        return json.dumps(self._to_payload(), ensure_ascii=False)
+
+    def to_msgpack(self):
+        """ממיר את המסלול ל־bytes בפורמט msgpack (לשמירה במסד הנתונים)"""
+        return msgpack.packb(self._to_payload(), use_bin_type=True)
+
 
 
     def set_helpful_theorems(self, theorem_ids):
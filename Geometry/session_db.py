@@ -1,41 +1,198 @@
+import os
 import sqlite3
 import json
 
+try:
+    import orjson  # פענוח JSON מהיר (C) – אופציונלי
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack  # שמירת מסלולים כ־BLOB בינארי קומפקטי – אופציונלי
+except ImportError:
+    msgpack = None
+
+# שמירה בפורמט msgpack היא בחירה מפורשת של המפעיל (SESSIONS_MSGPACK=True), ולא תלויה רק בכך
+# שהחבילה מותקנת: אחרי שנשמר מסלול כ־msgpack, כל תהליך שקורא את המסד (ה־API, theorems_score_db,
+# dynamic_multiplier_db) חייב את החבילה. ברירת המחדל – JSON, שכל קורא יכול לפענח
+USE_MSGPACK = os.environ.get('SESSIONS_MSGPACK', 'False').lower() == 'true'
+
+# הגדרות לכל חיבור: WAL (קוראים במקביל לכותב), סנכרון NORMAL (ללא fsync כפול בכל INSERT),
+# טבלאות זמניות בזיכרון, מטמון של ~20MB ו־mmap של 256MB.
+# auto_vacuum חייב לבוא ראשון – במסד חדש הוא נקבע רק לפני שה־WAL כותב את כותרת הקובץ
+CONNECTION_PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+
+def _connect(db_path):
+    """פותחת חיבור למסד המסלולים עם הגדרות הביצועים"""
+    conn = sqlite3.connect(db_path)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+# מבנה טבלת המסלולים: session_id הוא המפתח הראשי (בלי עמודת id נפרדת).
+# הטבלה נשארת טבלת rowid – ה־rowid עולה עם כל הכנסה ושומר את סדר שמירת המסלולים,
+# שעליו נשענים הטעינה וההיסטוריה המדופדפת (offset/limit) ב־API
+_SESSIONS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        session_id TEXT PRIMARY KEY NOT NULL,
+        data BLOB NOT NULL  -- המסלול: msgpack (או JSON ברשומות ישנות)
+    )
+'''
+
+# שאילתת השמירה (משותפת ל־save_session ול־save_sessions)
+_INSERT_SQL = "INSERT INTO sessions (session_id, data) VALUES (?, ?)"
+
+
+def _decode(data):
+    """
+    מפענח את עמודת data של מסלול כפי שנשמרה: BLOB של msgpack או מחרוזת JSON (רשומות ישנות).
+    JSON מפוענח עם orjson אם זמין.
+    """
+    if isinstance(data, bytes):
+        if msgpack is None:
+            raise RuntimeError("המסלול שמור בפורמט msgpack – יש להתקין את החבילה msgpack")
+        return msgpack.unpackb(data, raw=False)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def loads_session(data):
+    """
+    מפענח מסלול ומחזיר אותו במבנה המפורט (אינטראקציות כמילונים {"question_id", "answer_id"}),
+    גם כשהוא שמור בפורמט גרסה 2 (אינטראקציות כזוגות).
+    """
+    payload = _decode(data)
+    if payload.pop("v", 1) >= 2:
+        payload["interactions"] = [
+            {"question_id": q, "answer_id": a} for q, a in payload["interactions"]
+        ]
+    return payload
+
+
+def _encode(session):
+    """מקודד מסלול לשמירה: מחרוזת JSON, או BLOB של msgpack אם הופעל SESSIONS_MSGPACK"""
+    if USE_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("SESSIONS_MSGPACK מופעל – יש להתקין את החבילה msgpack")
+        return sqlite3.Binary(session.to_msgpack())
+    return session._to_storage_json()
+
+
+def dumps_pretty(obj):
+    """ממיר מסלול למחרוזת JSON קריאה להדפסה"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, indent=4, ensure_ascii=False)
+
 class SessionDB:
-    def __init__(self, db_path="sessions.db"):
+    def __init__(self, db_path="sessions.db", conn=None):
         self.db_path = db_path
+        # חיבור אחד לכל חיי האובייקט (אפשר להעביר חיבור קיים, למשל מסד בזיכרון לבדיקות)
+        self._conn = conn if conn is not None else _connect(self.db_path)
         self._init_db()
 
     def _init_db(self):
-        """יוצרת את טבלת המסלולים אם היא לא קיימת"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT UNIQUE,
-                    data TEXT  -- JSON שמכיל את המסלול
-                )
-            ''')
-            conn.commit()
+        """
+        יוצרת את טבלת המסלולים אם היא לא קיימת.
+        טבלה קיימת לא משתנה כאן – גם טבלה ישנה (עם עמודת id) נקראת ונכתבת כרגיל,
+        וההמרה שלה נעשית רק בקריאה מפורשת ל־migrate_legacy_table.
+        """
+        with self._conn:
+            self._conn.execute(_SESSIONS_TABLE_SQL.format(table="sessions"))
+
+    def migrate_legacy_table(self):
+        """
+        המרה חד־פעמית של טבלה ישנה (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id UNIQUE)
+        למבנה הנוכחי, בטרנזקציה אחת. ערכי id נשמרים כ־rowid, כך שסדר המסלולים לא משתנה.
+        מחזירה את מספר הרשומות שהועתקו, או None אם הטבלה כבר במבנה הנוכחי.
+        """
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "id" not in columns:
+            return None
+
+        try:
+            self._conn.executescript(
+                "BEGIN;"
+                + _SESSIONS_TABLE_SQL.format(table="sessions_new") + ";"
+                + '''
+                INSERT INTO sessions_new (rowid, session_id, data)
+                    SELECT id, session_id, data FROM sessions
+                    WHERE session_id IS NOT NULL AND data IS NOT NULL
+                    ORDER BY id;
+                DROP TABLE sessions;
+                ALTER TABLE sessions_new RENAME TO sessions;
+                COMMIT;
+                '''
+            )
+        except sqlite3.Error:
+            self._conn.rollback()
+            raise
+        return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
 
     def save_session(self, session):
         """שומר מסלול חדש במסד הנתונים"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO sessions (session_id, data)
-                VALUES (?, ?)
-            ''', (session.session_id, session.to_json()))
-            conn.commit()
+        with self._conn:  # commit אוטומטי בסיום הבלוק
+            self._conn.execute(_INSERT_SQL, (session.session_id, _encode(session)))
+
+    def save_sessions(self, sessions):
+        """שומר כמה מסלולים בטרנזקציה אחת (commit יחיד לכל הקבוצה)"""
+        with self._conn:
+            self._conn.executemany(_INSERT_SQL, ((session.session_id, _encode(session)) for session in sessions))
+
+    def iter_sessions(self):
+        """
+        מחזיר את המסלולים אחד־אחד תוך כדי מעבר על הקורסור (בלי להחזיק את כל השורות בזיכרון),
+        לפי סדר השמירה שלהם.
+        """
+        # rowid הוא id בטבלה הישנה, ובמבנה הנוכחי הוא עולה עם כל הכנסה
+        for (data,) in self._conn.execute("SELECT data FROM sessions ORDER BY rowid"):
+            yield loads_session(data)
 
     def load_all_sessions(self):
         """טוען את כל המסלולים מה-DB"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT data FROM sessions")
-            rows = cursor.fetchall()
-            return [json.loads(row[0]) for row in rows] if rows else []
+        return list(self.iter_sessions())
+
+    def migrate_to_msgpack(self):
+        """
+        המרה חד־פעמית של רשומות JSON ישנות (טקסט) ל־BLOB של msgpack, בטרנזקציה אחת.
+        מחזירה את מספר הרשומות שהומרו.
+        """
+        if msgpack is None:
+            raise RuntimeError("להמרה נדרשת החבילה msgpack")
+
+        rows = self._conn.execute(
+            "SELECT session_id, data FROM sessions WHERE typeof(data) = 'text'"
+        ).fetchall()
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE sessions SET data = ? WHERE session_id = ?",
+                ((sqlite3.Binary(msgpack.packb(_decode(data), use_bin_type=True)), session_id)
+                 for session_id, data in rows)
+            )
+        return len(rows)
+
+    def enable_incremental_vacuum(self):
+        """
+        המרה חד־פעמית של מסד קיים ל־auto_vacuum=INCREMENTAL (דורשת VACUUM מלא אחד).
+        לאחר מכן אפשר לשחרר דפים פנויים עם PRAGMA incremental_vacuum, בלי לכתוב מחדש את כל הקובץ.
+        """
+        if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._conn.execute("VACUUM")
+
+    def close(self):
+        """סוגר את החיבור למסד הנתונים"""
+        self._conn.close()
 
 
 
@@ -47,5 +204,7 @@ if __name__ == "__main__":
 
     for i, session in enumerate(sessions, 1):
         print(f"📄 סשן {i}:")
-        print(json.dumps(session, indent=4, ensure_ascii=False))
+        print(dumps_pretty(session))
         print("=" * 60)
+
+    db.close()
@@ -6,7 +6,21 @@ It verifies that the core modules can be imported and basic operations work.
 """
 
 import sys
-import os
+
+
+def _in_memory_copy(db_name):
+    """
+    Snapshot a database into an in-memory connection so the tests run entirely in RAM
+    and never write to the real file. Uses SQLite's online backup API, which also picks
+    up pages still in the WAL file.
+    """
+    import sqlite3  # only the database tests need it
+
+    mem = sqlite3.connect(":memory:")
+    src = sqlite3.connect(db_name)
+    src.backup(mem)
+    src.close()
+    return mem
 
 def test_imports():
     """Test that all core modules can be imported."""
@@ -41,10 +55,11 @@ def test_geometry_manager():
     print("\nTesting GeometryManager...")
     
     try:
+        import os
         from geometry_manager import GeometryManager
         
-        # Create manager
-        gm = GeometryManager()
+        # Create manager (on an in-memory snapshot of the database)
+        gm = GeometryManager(conn=_in_memory_copy("geometry_learning.db"))
         print("✓ GeometryManager instantiated")
         
         # Check database connection
@@ -108,6 +123,14 @@ def test_session():
             return False
         print("✓ Session converted to JSON")
         
+        # to_json is the public format: verbose interactions, no storage version
+        import json
+        parsed = json.loads(json_str)
+        if "v" in parsed or parsed["interactions"] != [{"question_id": 1, "answer_id": 1}]:
+            print(f"✗ to_json() returned the storage format: {json_str}")
+            return False
+        print("✓ to_json() uses the public (verbose) format")
+        
         return True
         
     except Exception as e:
@@ -123,14 +146,86 @@ def test_session_db():
         from session_db import SessionDB
         from session import Session
         
-        # Create session DB
-        session_db = SessionDB()
+        # Create session DB (on an in-memory snapshot of the database)
+        session_db = SessionDB(conn=_in_memory_copy("sessions.db"))
         print("✓ SessionDB instantiated")
         
         # Load sessions
         sessions = session_db.load_all_sessions()
         print(f"✓ Loaded {len(sessions)} sessions from database")
         
+        def count_rows():
+            return session_db._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        
+        # Migrate a legacy table (id column) - rows and their order must be preserved
+        rows_before = count_rows()
+        migrated = session_db.migrate_legacy_table()
+        if migrated is None:
+            print("✓ Sessions table already uses the current schema")
+        else:
+            if migrated != rows_before or count_rows() != rows_before:
+                print(f"✗ Migration copied {migrated} of {rows_before} sessions")
+                return False
+            if session_db.load_all_sessions() != sessions:
+                print("✗ Sessions changed (or were reordered) by the migration")
+                return False
+            print(f"✓ Legacy sessions table migrated ({migrated} sessions preserved)")
+        
+        # A saved (v2) session loads back with verbose interactions, as the last session
+        sess = Session()
+        sess.add_interaction(3, 1)
+        sess.add_interaction(7, 0)
+        session_db.save_session(sess)
+        loaded = session_db.load_all_sessions()[-1]
+        expected = [{"question_id": 3, "answer_id": 1}, {"question_id": 7, "answer_id": 0}]
+        if loaded.get("session_id") != sess.session_id or "v" in loaded \
+                or loaded.get("interactions") != expected:
+            print(f"✗ Saved session did not load back as expected: {loaded}")
+            return False
+        print("✓ Saved session loaded back with verbose interactions")
+        
+        # save_sessions inserts the whole batch
+        rows_before = count_rows()
+        session_db.save_sessions([Session() for _ in range(3)])
+        if count_rows() != rows_before + 3:
+            print("✗ save_sessions did not insert the whole batch")
+            return False
+        print("✓ save_sessions inserted the whole batch")
+        
+        # migrate_to_msgpack converts every JSON row without changing the sessions
+        # (and refuses to run when msgpack is not installed)
+        import session_db as session_db_module
+        sessions = session_db.load_all_sessions()
+        text_rows = session_db._conn.execute(
+            "SELECT COUNT(*) FROM sessions WHERE typeof(data) = 'text'").fetchone()[0]
+        if session_db_module.msgpack is None:
+            try:
+                session_db.migrate_to_msgpack()
+                print("✗ migrate_to_msgpack ran without msgpack installed")
+                return False
+            except RuntimeError:
+                print("✓ migrate_to_msgpack refuses to run without msgpack")
+        else:
+            converted = session_db.migrate_to_msgpack()
+            text_left = session_db._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE typeof(data) = 'text'").fetchone()[0]
+            if converted != text_rows or text_left or session_db.load_all_sessions() != sessions:
+                print(f"✗ migrate_to_msgpack converted {converted} of {text_rows} sessions")
+                return False
+            print(f"✓ migrate_to_msgpack converted {converted} sessions")
+        
+        # enable_incremental_vacuum switches the database to auto_vacuum=INCREMENTAL
+        session_db.enable_incremental_vacuum()
+        if session_db._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("✗ enable_incremental_vacuum did not enable auto_vacuum=INCREMENTAL")
+            return False
+        if session_db.load_all_sessions() != sessions:
+            print("✗ Sessions changed by enable_incremental_vacuum")
+            return False
+        print("✓ enable_incremental_vacuum enabled auto_vacuum=INCREMENTAL")
+        
+        session_db.close()
+        
         return True
         
     except Exception as e:
@@ -1,11 +1,84 @@
 import sqlite3
+import sys
+from collections import Counter, namedtuple
+from itertools import product
 from session_db import SessionDB
 import json
 
 
-session_db = SessionDB("sessions.db")
-sessions = session_db.load_all_sessions()
-print(f"🔍 נטענו {len(sessions)} סשנים מה־DB.")
+# מזהי כל המשפטים (1–63), נבנים פעם אחת ברמת המודול
+_THEOREMS = tuple(range(1, 64))
+
+# הגדרות לכתיבה מרוכזת: WAL (בלי שכתוב יומן), סנכרון NORMAL (בלי fsync לכל commit),
+# טבלאות זמניות בזיכרון ומטמון של ~64MB.
+# foreign_keys מוגדר כאן, פעם אחת לחיבור – בתוך טרנזקציה פתוחה SQLite מתעלם ממנו
+BULK_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
+
+
+def _tune(conn):
+    """מפעילה על החיבור את הגדרות הכתיבה המרוכזת (לפני פתיחת טרנזקציה)"""
+    for pragma in BULK_PRAGMAS:
+        conn.execute(pragma)
+
+
+def _begin(conn):
+    """
+    פותחת טרנזקציה אם עוד אין אחת פתוחה על החיבור.
+    מחזירה True אם הטרנזקציה נפתחה כאן (ואז הפונקציה הקוראת אחראית ל־commit).
+    """
+    if conn.in_transaction:
+        return False
+    conn.execute("BEGIN")
+    return True
+
+
+def _commit(conn, owned):
+    """מבצעת commit רק אם הטרנזקציה נפתחה ע"י אותה פונקציה (ראו _begin)"""
+    if owned:
+        conn.commit()
+
+
+# תוצאת מעבר יחיד על הסשנים:
+# total_counts:    (qid, aid) -> כמה פעמים הופיע הצירוף
+# helpful_counts:  (qid, aid, tid) -> כמה פעמים המשפט סייע בצירוף
+# session_counts:  tid -> בכמה סשנים המשפט סייע
+# total_sessions:  מספר הסשנים
+AggregatedStats = namedtuple(
+    "AggregatedStats", ["total_counts", "helpful_counts", "session_counts", "total_sessions"]
+)
+
+
+def aggregate_sessions(sessions):
+    """
+    עוברת על הסשנים פעם אחת בלבד ומחזירה את כל המונים הדרושים לעדכון הטבלאות.
+    """
+    total_counts = Counter()
+    helpful_counts = Counter()
+    session_counts = Counter()
+
+    for session in sessions:
+        interactions = session.get("interactions", [])
+        helpful_theorems = session.get("helpful_theorems", [])
+
+        for interaction in interactions:
+            qid = interaction.get("question_id")
+            aid = interaction.get("answer_id")
+
+            total_counts[(qid, aid)] += 1
+            # אם היו helpful_theorems – רק להם נספור count_helpful
+            for tid in helpful_theorems:
+                helpful_counts[(qid, aid, tid)] += 1
+
+        # כל משפט נספר פעם אחת לכל סשן (frozenset מסיר כפילויות)
+        session_counts.update(frozenset(helpful_theorems))
+
+    return AggregatedStats(total_counts, helpful_counts, session_counts, len(sessions))
 
 
 #בדיקה לטבלאות
@@ -37,13 +110,11 @@ print(f"🔍 נטענו {len(sessions)} סשנים מה־DB.")
 #         print(json.dumps(session, indent=4, ensure_ascii=False))
 
 
-def create_theorem_scores_table(db_path="geometry_learning.db"):
-    conn = sqlite3.connect(db_path)
+def create_theorem_scores_table(conn):
     cursor = conn.cursor()
 
-    # הפעלת תמיכה במפתחות זרים אם תרצה בעתיד להשתמש בזה
-    cursor.execute("PRAGMA foreign_keys = ON;")
-
+    # תמיכה במפתחות זרים (אם תרצה בעתיד להשתמש בזה) מופעלת ב־_tune, יחד עם שאר הגדרות החיבור
+    owned = _begin(conn)
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS TheoremScores (
         question_id INTEGER,
@@ -53,142 +124,136 @@ def create_theorem_scores_table(db_path="geometry_learning.db"):
         count_helpful INTEGER DEFAULT 0,
         score REAL ,
         PRIMARY KEY (question_id, answer_id, theorem_id)
-    )
+    ) WITHOUT ROWID
     """)
 
-    conn.commit()
-    conn.close()
+    _commit(conn, owned)
     print("✅ טבלת TheoremScores נוצרה בהצלחה עם ערכי ברירת מחדל.")
 
 
 
-def populate_theorem_scores_initial(db_path="geometry_learning.db"):
+def populate_theorem_scores_initial(conn):
     """
     מאתחל את הטבלה TheoremScores עם כל הצירופים האפשריים של שאלה, תשובה ומשפט.
     """
-    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    inserted = 0
-
-    for question_id in range(1, 29):  # כולל 28
-        for answer_id in range(0, 4):  # כולל 3
-            for theorem_id in range(1, 64):  # כולל 63
-                cursor.execute("""
-                    INSERT OR IGNORE INTO TheoremScores (
-                        question_id, answer_id, theorem_id,
-                        count_total, count_helpful, score
-                    ) VALUES (?, ?, ?, 0, 0, 0)
-                """, (question_id, answer_id, theorem_id))
-                inserted += 1
-
-    conn.commit()
-    conn.close()
-    print(f"✅ הוזנו {inserted} רשומות ראשוניות לטבלת TheoremScores.")
-
-def print_theorem_scores_table(db_path="geometry_learning.db"):
+    question_ids = range(1, 29)  # כולל 28
+    answer_ids = range(0, 4)  # כולל 3
+    # הצירופים מוזרמים ישירות ל־executemany, בלי לבנות רשימה בזיכרון
+    rows = product(question_ids, answer_ids, _THEOREMS)
+    total_rows = len(question_ids) * len(answer_ids) * len(_THEOREMS)
+
+    # כל ההכנסות בטרנזקציה אחת
+    owned = _begin(conn)
+    cursor.executemany("""
+        INSERT OR IGNORE INTO TheoremScores (
+            question_id, answer_id, theorem_id,
+            count_total, count_helpful, score
+        ) VALUES (?, ?, ?, 0, 0, 0)
+    """, rows)
+    _commit(conn, owned)
+    print(f"✅ הוזנו {total_rows} רשומות ראשוניות לטבלת TheoremScores.")
+
+def print_theorem_scores_table(conn):
         """
         מדפיסה את 300 הרשומות הראשונות מטבלת TheoremScores לצורכי בדיקה.
         """
-        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
 
-        cursor.execute("SELECT * FROM TheoremScores")
+        # הספירה נעשית ב־SQL, כך שרק 300 השורות המודפסות נטענות לזיכרון
+        total_rows = cursor.execute("SELECT COUNT(*) FROM TheoremScores").fetchone()[0]
+
+        cursor.execute("SELECT * FROM TheoremScores LIMIT 300")
         rows = cursor.fetchall()
 
         if not rows:
             print("⚠️ הטבלה TheoremScores ריקה.")
         else:
             column_names = [description[0] for description in cursor.description]
-            print(f"\n📊 נמצאו {len(rows)} רשומות בטבלה TheoremScores.\n")
+            print(f"\n📊 נמצאו {total_rows} רשומות בטבלה TheoremScores.\n")
             print(" | ".join(column_names))
             print("-" * 100)
-            for row in rows[:300]:  # מדפיס את 300 הראשונים
-                print(" | ".join(str(cell) for cell in row))
+            # כתיבה אחת ל־stdout במקום print לכל שורה
+            sys.stdout.write("\n".join(" | ".join(map(str, row)) for row in rows) + "\n")
 
-        conn.close()
 
-def update_counts_from_sessions(sessions, db_path="geometry_learning.db"):
+def update_counts_from_sessions(stats, conn):
     """
-    מעדכן את count_total ו־count_helpful בטבלת TheoremScores לפי נתוני הסשנים.
+    מעדכן את count_total ו־count_helpful בטבלת TheoremScores לפי המונים
+    שנצברו ב־aggregate_sessions.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    total_counts = stats.total_counts
+    helpful_counts = stats.helpful_counts
 
-    total_updated = 0
-    helpful_updated = 0
+    # טעינת המונים לטבלאות זמניות ועדכון TheoremScores בשתי פקודות UPDATE
+    cursor = conn.cursor()
 
-    for session in sessions:
-        interactions = session.get("interactions", [])
-        helpful_theorems = session.get("helpful_theorems", [])
+    owned = _begin(conn)
+    cursor.execute("CREATE TEMP TABLE tmp_total (qid INTEGER, aid INTEGER, n INTEGER)")
+    cursor.execute("CREATE TEMP TABLE tmp_helpful (qid INTEGER, aid INTEGER, tid INTEGER, n INTEGER)")
+    cursor.executemany("INSERT INTO tmp_total VALUES (?, ?, ?)",
+                       ((qid, aid, n) for (qid, aid), n in total_counts.items()))
+    cursor.executemany("INSERT INTO tmp_helpful VALUES (?, ?, ?, ?)",
+                       ((qid, aid, tid, n) for (qid, aid, tid), n in helpful_counts.items()))
 
-        for interaction in interactions:
-            qid = interaction.get("question_id")
-            aid = interaction.get("answer_id")
+    # count_total מתעדכן לכל המשפטים (1–63) של כל צירוף שהופיע
+    cursor.execute("""
+        UPDATE TheoremScores
+        SET count_total = count_total + (
+            SELECT t.n FROM tmp_total t
+            WHERE t.qid = TheoremScores.question_id AND t.aid = TheoremScores.answer_id
+        )
+        WHERE theorem_id BETWEEN 1 AND 63
+          AND (question_id, answer_id) IN (SELECT qid, aid FROM tmp_total)
+    """)
+    cursor.execute("""
+        UPDATE TheoremScores
+        SET count_helpful = count_helpful + (
+            SELECT h.n FROM tmp_helpful h
+            WHERE h.qid = TheoremScores.question_id AND h.aid = TheoremScores.answer_id
+              AND h.tid = TheoremScores.theorem_id
+        )
+        WHERE (question_id, answer_id, theorem_id) IN (SELECT qid, aid, tid FROM tmp_helpful)
+    """)
 
-            # עדכון count_total לכל המשפטים עבור הצירוף הזה
-            for theorem_id in range(1, 64):
-                cursor.execute("""
-                    UPDATE TheoremScores
-                    SET count_total = count_total + 1
-                    WHERE question_id = ? AND answer_id = ? AND theorem_id = ?
-                """, (qid, aid, theorem_id))
-                total_updated += 1
+    cursor.execute("DROP TABLE tmp_total")
+    cursor.execute("DROP TABLE tmp_helpful")
+    _commit(conn, owned)
 
-            # אם היו helpful_theorems – נעדכן רק להם את count_helpful
-            for tid in helpful_theorems:
-                cursor.execute("""
-                    UPDATE TheoremScores
-                    SET count_helpful = count_helpful + 1
-                    WHERE question_id = ? AND answer_id = ? AND theorem_id = ?
-                """, (qid, aid, tid))
-                helpful_updated += 1
-
-    conn.commit()
-    conn.close()
+    # אותם מונים כמו בעדכון שורה־שורה: 63 משפטים לכל אינטראקציה, ומשפט מסייע לכל אינטראקציה
+    total_updated = len(_THEOREMS) * sum(total_counts.values())
+    helpful_updated = sum(helpful_counts.values())
     print(f"✅ עודכנו {total_updated} ערכי count_total ו־{helpful_updated} ערכי count_helpful.")
 
 
-def update_score_column(db_path="geometry_learning.db"):
+def update_score_column(conn):
     """
     מעדכנת את עמודת score בטבלת TheoremScores לפי:
     score = count_helpful / count_total
     רק אם count_total > 0
     """
-    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    # שליפת כל השורות עם count_total > 0
+    # החישוב כולו מתבצע ב־SQL, בסריקה אחת של הטבלה
+    owned = _begin(conn)
     cursor.execute("""
-        SELECT question_id, answer_id, theorem_id, count_total, count_helpful
-        FROM TheoremScores
+        UPDATE TheoremScores
+        SET score = CAST(count_helpful AS REAL) / count_total
         WHERE count_total > 0
     """)
-    rows = cursor.fetchall()
-
-    updated = 0
-    for qid, aid, tid, total, helpful in rows:
-        score = helpful / total
-        cursor.execute("""
-            UPDATE TheoremScores
-            SET score = ?
-            WHERE question_id = ? AND answer_id = ? AND theorem_id = ?
-        """, (score, qid, aid, tid))
-        updated += 1
-
-    conn.commit()
-    conn.close()
+    updated = cursor.rowcount
+
+    _commit(conn, owned)
     print(f"✅ עודכנו {updated} ערכים בעמודת score בטבלת TheoremScores.")
 
 
 
 
-def create_general_helpfulness_table(db_path="geometry_learning.db"):
-    conn = sqlite3.connect(db_path)
+def create_general_helpfulness_table(conn):
     cursor = conn.cursor()
 
-    cursor.execute("PRAGMA foreign_keys = ON;")
-
+    owned = _begin(conn)
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS TheoremGeneralHelpfulness (
         theorem_id INTEGER PRIMARY KEY,
@@ -197,122 +262,102 @@ def create_general_helpfulness_table(db_path="geometry_learning.db"):
     )
     """)
 
-    conn.commit()
-    conn.close()
+    _commit(conn, owned)
     print("✅ טבלת TheoremGeneralHelpfulness נוצרה בהצלחה (רק עם theorem_id ו-general_helpfulness).")
 
 
-def populate_general_helpfulness_table(db_path="geometry_learning.db"):
+def populate_general_helpfulness_table(conn):
     """
     מאתחל את טבלת TheoremGeneralHelpfulness עם ערכים התחלתיים:
     helpful_session_count = 0, general_helpfulness = 0.2 לכל המשפטים 1–63.
     """
-    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    inserted = 0
-    for theorem_id in range(1, 64):  # כולל 63
-        cursor.execute("""
-            INSERT OR IGNORE INTO TheoremGeneralHelpfulness (
-                theorem_id, helpful_session_count, general_helpfulness
-            ) VALUES (?, 0, 0)
-        """, (theorem_id,))
-        inserted += 1
+    rows = ((theorem_id,) for theorem_id in _THEOREMS)
 
-    conn.commit()
-    conn.close()
-    print(f"✅ הוזנו {inserted} רשומות לטבלת TheoremGeneralHelpfulness עם ערכים התחלתיים.")
+    owned = _begin(conn)
+    cursor.executemany("""
+        INSERT OR IGNORE INTO TheoremGeneralHelpfulness (
+            theorem_id, helpful_session_count, general_helpfulness
+        ) VALUES (?, 0, 0)
+    """, rows)
+    _commit(conn, owned)
+    print(f"✅ הוזנו {len(_THEOREMS)} רשומות לטבלת TheoremGeneralHelpfulness עם ערכים התחלתיים.")
 
 
-def recompute_helpful_session_count(sessions, db_path="geometry_learning.db"):
+def recompute_helpful_session_count(stats, conn):
     """
     מחשבת מחדש את helpful_session_count בטבלת TheoremGeneralHelpfulness
-    על סמך כל הסשנים, ומאפס לפני כן את הטבלה.
+    על סמך כל הסשנים (לפי stats.session_counts), ומאפס לפני כן את הטבלה.
     """
-    from collections import defaultdict
-
-    # שלב 1: ספירת מופעים מחדש
-    helpful_counts = defaultdict(int)
-
-    for session in sessions:
-        unique_theorems = set(session.get("helpful_theorems", []))
-        for tid in unique_theorems:
-            helpful_counts[tid] += 1
+    helpful_counts = stats.session_counts
 
-    # שלב 2: עדכון בטבלה
-    conn = sqlite3.connect(db_path)
+    # עדכון בטבלה – המונים נטענים לטבלה זמנית, והאיפוס והעדכון נעשים ב־UPDATE אחד
     cursor = conn.cursor()
 
-    # אפס את כל המונים
-    cursor.execute("UPDATE TheoremGeneralHelpfulness SET helpful_session_count = 0")
+    owned = _begin(conn)
+    cursor.execute("CREATE TEMP TABLE tmp_hc (theorem_id INTEGER PRIMARY KEY, n INTEGER)")
+    cursor.executemany("INSERT INTO tmp_hc VALUES (?, ?)", helpful_counts.items())
 
-    updated = 0
-    for tid, count in helpful_counts.items():
-        cursor.execute("""
-            UPDATE TheoremGeneralHelpfulness
-            SET helpful_session_count = ?
-            WHERE theorem_id = ?
-        """, (count, tid))
-        updated += 1
+    # משפט שלא הופיע באף סשן מקבל 0
+    cursor.execute("""
+        UPDATE TheoremGeneralHelpfulness
+        SET helpful_session_count = IFNULL(
+            (SELECT n FROM tmp_hc WHERE tmp_hc.theorem_id = TheoremGeneralHelpfulness.theorem_id), 0
+        )
+    """)
 
-    conn.commit()
-    conn.close()
-    print(f"✅ חושבו מחדש {updated} ערכים של helpful_session_count.")
+    cursor.execute("DROP TABLE tmp_hc")
+    _commit(conn, owned)
+    print(f"✅ חושבו מחדש {len(helpful_counts)} ערכים של helpful_session_count.")
 
 
-def update_general_helpfulness(sessions, db_path="geometry_learning.db"):
+def update_general_helpfulness(stats, conn):
     """
     מעדכנת את הערך general_helpfulness עבור כל משפט בטבלת TheoremGeneralHelpfulness.
     היחס מחושב כך: helpful_session_count / total_sessions
     """
 
 
-    total_sessions = len(sessions)
+    total_sessions = stats.total_sessions
     if total_sessions == 0:
         print("⚠️ אין סשנים לעדכן על פיהם את general_helpfulness.")
         return
 
-    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    cursor.execute("SELECT theorem_id, helpful_session_count FROM TheoremGeneralHelpfulness")
-    rows = cursor.fetchall()
-
-    updated = 0
-    for tid, count in rows:
-        new_score = count / total_sessions
-        cursor.execute("""
-            UPDATE TheoremGeneralHelpfulness
-            SET general_helpfulness = ?
-            WHERE theorem_id = ?
-        """, (new_score, tid))
-        updated += 1
-
-    conn.commit()
-    conn.close()
+    # החישוב כולו מתבצע ב־SQL, בפקודה אחת
+    owned = _begin(conn)
+    cursor.execute("""
+        UPDATE TheoremGeneralHelpfulness
+        SET general_helpfulness = CAST(helpful_session_count AS REAL) / ?
+    """, (total_sessions,))
+    updated = cursor.rowcount
+
+    _commit(conn, owned)
     print(f"✅ עודכנו {updated} ערכי general_helpfulness בטבלה לפי {total_sessions} סשנים.")
 
-def print_general_helpfulness_table(db_path="geometry_learning.db"):
+def print_general_helpfulness_table(conn):
     """
     מדפיסה את כל הרשומות מטבלת TheoremGeneralHelpfulness.
     """
-    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    cursor.execute("SELECT * FROM TheoremGeneralHelpfulness")
-    rows = cursor.fetchall()
+    # עיצוב השורות נעשה ב־SQLite (printf), כך ש־Python רק מדפיס את המחרוזת המוכנה
+    cursor.execute("""
+        SELECT printf('%d | %d | %.4f', theorem_id, helpful_session_count, general_helpfulness)
+        FROM TheoremGeneralHelpfulness
+    """)
+    lines = [row[0] for row in cursor]
 
-    if not rows:
+    if not lines:
         print("⚠️ הטבלה TheoremGeneralHelpfulness ריקה.")
     else:
-        column_names = [description[0] for description in cursor.description]
-        print(f"\n📊 נמצאו {len(rows)} רשומות בטבלה TheoremGeneralHelpfulness:\n")
-        print(" | ".join(column_names))
+        print(f"\n📊 נמצאו {len(lines)} רשומות בטבלה TheoremGeneralHelpfulness:\n")
+        print("theorem_id | helpful_session_count | general_helpfulness")
         print("-" * 60)
-        for row in rows:
-            print(" | ".join(str(cell) for cell in row))
+        sys.stdout.write("\n".join(lines) + "\n")
 
-    conn.close()
 
 
 
@@ -321,21 +366,39 @@ def print_general_helpfulness_table(db_path="geometry_learning.db"):
 if __name__ == "__main__":
             # check_tables()
             # preview_sessions_from_db()
-            # יצירת טבלאות
-
-            create_theorem_scores_table()
-            populate_theorem_scores_initial()
-            create_general_helpfulness_table()
-            populate_general_helpfulness_table()
-
-            # עדכון טבלת TheoremScores
-            update_counts_from_sessions(sessions)
-            update_score_column()
-            print_theorem_scores_table()
-
-            # עדכון טבלת TheoremGeneralHelpfulness
-            recompute_helpful_session_count(sessions)
-            update_general_helpfulness(sessions)
-            print_general_helpfulness_table()
-
 
+            # טעינת הסשנים רק בהרצה ישירה, ולא בזמן import של המודול
+            session_db = SessionDB("sessions.db")
+            sessions = session_db.load_all_sessions()
+            session_db.close()
+            print(f"🔍 נטענו {len(sessions)} סשנים מה־DB.")
+
+            # חיבור אחד לכל השלבים – המטמון של SQLite נשאר "חם" בין הפונקציות
+            conn = sqlite3.connect("geometry_learning.db")
+            _tune(conn)
+            # מעבר יחיד על הסשנים – כל שלבי העדכון משתמשים באותם מונים
+            stats = aggregate_sessions(sessions)
+            try:
+                # כל השלבים רצים בטרנזקציה אחת – commit (ו־fsync) יחיד בסוף.
+                # הפונקציות מזהות שהטרנזקציה כבר פתוחה ולא מבצעות commit בעצמן
+                conn.execute("BEGIN IMMEDIATE")
+
+                # יצירת טבלאות
+                create_theorem_scores_table(conn)
+                populate_theorem_scores_initial(conn)
+                create_general_helpfulness_table(conn)
+                populate_general_helpfulness_table(conn)
+
+                # עדכון טבלת TheoremScores
+                update_counts_from_sessions(stats, conn)
+                update_score_column(conn)
+                print_theorem_scores_table(conn)
+
+                # עדכון טבלת TheoremGeneralHelpfulness
+                recompute_helpful_session_count(stats, conn)
+                update_general_helpfulness(stats, conn)
+                print_general_helpfulness_table(conn)
+
+                conn.commit()
+            finally:
+                conn.close()
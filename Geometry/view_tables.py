@@ -23,13 +23,16 @@ else:
         print(f"\n📜 תוכן טבלת {table_name}:")
 
         try:
-            cursor.execute(f"SELECT * FROM {table_name};")
-            rows = cursor.fetchall()
+            quoted_name = table_name.replace('"', '""')
+            cursor.execute(f'SELECT * FROM "{quoted_name}";')
 
-            if rows:
-                for row in rows:
-                    print(row)
-            else:
+            # מעבר ישיר על הסמן – השורות נשלפות אחת־אחת ולא נטענות כולן לזיכרון
+            has_rows = False
+            for row in cursor:
+                print(row)
+                has_rows = True
+
+            if not has_rows:
                 print("⚠️ אין נתונים בטבלה.")
 
             print("=" * 50)